@@ -0,0 +1,112 @@
+import logging
+import tempfile
+from playwright.async_api import async_playwright
+
+
+class BrowserSession:
+    """
+    One persistent Chromium context shared by CarScraper and DetailsScraping.
+    The profile directory keeps the HTTP disk cache, cookies and service workers, so the
+    site's scripts and styles are downloaded once per run (or once across runs when the
+    same user_data_dir is given again).
+    """
+
+    def __init__(self, user_data_dir=None, headless=True):
+        self.user_data_dir = user_data_dir    # Profile to reuse across runs; a temporary one if None
+        self.headless = headless
+        self.playwright = None
+        self.context = None
+        self.temp_dir = None                  # Holds the temporary profile when no user_data_dir is given
+        self.logger = logging.getLogger(__name__)
+
+        # Network statistics, collected through the Chrome DevTools protocol
+        self.cache_hits = 0                   # Responses served from the disk cache / service worker
+        self.network_responses = 0            # Responses that went over the network
+        self.bytes_transferred = 0            # Encoded bytes received over the network
+        self.bytes_avoided = 0                # Estimated bytes not downloaded thanks to the cache
+        self.resource_sizes = {}              # URL -> bytes it took when last downloaded
+        self.pending_requests = {}            # CDP request id -> URL, until loading finishes
+
+    async def start(self):
+        """Launch the browser with a persistent context."""
+        if not self.user_data_dir:
+            self.temp_dir = tempfile.TemporaryDirectory(prefix="browser_profile_")
+        self.playwright = await async_playwright().start()
+        self.context = await self.playwright.chromium.launch_persistent_context(
+            self.user_data_dir or self.temp_dir.name,
+            headless=self.headless
+        )
+        return self
+
+    async def close(self):
+        """Close the browser, log the cache statistics and drop the temporary profile."""
+        try:
+            if self.context:
+                await self.context.close()
+            if self.playwright:
+                await self.playwright.stop()
+        finally:
+            self.context = None
+            self.playwright = None
+            if self.temp_dir:
+                self.temp_dir.cleanup()
+                self.temp_dir = None
+            self.log_cache_report()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def new_page(self):
+        """Open a tab in the shared context and track its network traffic."""
+        page = await self.context.new_page()
+        try:
+            cdp = await self.context.new_cdp_session(page)
+            await cdp.send('Network.enable')
+            cdp.on('Network.responseReceived', self.on_response_received)
+            cdp.on('Network.loadingFinished', self.on_loading_finished)
+            cdp.on('Network.loadingFailed', self.on_loading_failed)
+        except Exception as e:
+            # Statistics only, the page is usable without them
+            self.logger.debug(f"Network tracking unavailable: {e}")
+        return page
+
+    def on_response_received(self, params):
+        response = params.get('response', {})
+        url = response.get('url')
+        if response.get('fromDiskCache') or response.get('fromServiceWorker') or response.get('fromPrefetchCache'):
+            self.cache_hits += 1
+            headers = {key.lower(): value for key, value in response.get('headers', {}).items()}
+            try:
+                self.bytes_avoided += int(headers.get('content-length', ''))
+            except ValueError:
+                self.bytes_avoided += self.resource_sizes.get(url, 0)
+        else:
+            self.network_responses += 1
+            self.pending_requests[params.get('requestId')] = url
+
+    def on_loading_finished(self, params):
+        url = self.pending_requests.pop(params.get('requestId'), None)
+        if url is not None:
+            size = int(params.get('encodedDataLength', 0))
+            self.bytes_transferred += size
+            self.resource_sizes[url] = size
+
+    def on_loading_failed(self, params):
+        self.pending_requests.pop(params.get('requestId'), None)
+
+    def cache_hit_ratio(self):
+        total = self.cache_hits + self.network_responses
+        return self.cache_hits / total if total else 0.0
+
+    def log_cache_report(self):
+        total = self.cache_hits + self.network_responses
+        if not total:
+            return
+        self.logger.info(
+            f"Browser cache: {self.cache_hits}/{total} responses from cache ({self.cache_hit_ratio():.0%}), "
+            f"{self.bytes_avoided / 1024 / 1024:.1f} MB not transferred, "
+            f"{self.bytes_transferred / 1024 / 1024:.1f} MB downloaded"
+        )
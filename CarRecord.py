@@ -0,0 +1,75 @@
+import sys
+
+# Key sets of the specifications table, shared by every record that has the same attributes
+_spec_key_sets = {}
+
+
+def intern_text(value):
+    """Intern a repeated string so all records point to one copy of it."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CarRecord:
+    """
+    Compact, slotted record of one scraped ad.
+    Repeated values (pin status, categories, submitter data, spec keys/values) are interned,
+    and the specifications are kept as a shared key tuple plus a value tuple instead of a dict.
+    """
+
+    # Column order of the Excel sheets
+    columns = (
+        'id', 'date_published', 'relative_date', 'pin', 'type', 'title', 'description', 'link',
+        'image', 'price', 'address', 'additional_details', 'specifications', 'views_no',
+        'submitter', 'ads', 'membership', 'phone',
+    )
+
+    # Fields stored as plain attributes
+    plain_fields = (
+        'id', 'date_published', 'relative_date', 'pin', 'type', 'title', 'description', 'link',
+        'image', 'price', 'address', 'views_no', 'submitter', 'ads', 'membership', 'phone',
+    )
+
+    # Fields with few distinct values across a run
+    interned_fields = frozenset(('relative_date', 'pin', 'type', 'price', 'address', 'submitter', 'ads', 'membership'))
+
+    __slots__ = plain_fields + ('additional_details', 'spec_keys', 'spec_values')
+
+    def __init__(self, **fields):
+        for name in self.plain_fields:
+            value = fields.get(name)
+            setattr(self, name, intern_text(value) if name in self.interned_fields else value)
+
+        additional_details = fields.get('additional_details')
+        self.additional_details = (
+            tuple(intern_text(text) for text in additional_details) if additional_details is not None else None
+        )
+
+        specifications = fields.get('specifications')
+        if specifications is None:
+            self.spec_keys = None
+            self.spec_values = None
+        else:
+            keys = tuple(intern_text(key) for key in specifications)
+            self.spec_keys = _spec_key_sets.setdefault(keys, keys)
+            self.spec_values = tuple(intern_text(value) for value in specifications.values())
+
+    @property
+    def specifications(self):
+        if self.spec_keys is None:
+            return None
+        return dict(zip(self.spec_keys, self.spec_values))
+
+    def sort_key(self):
+        """Order used in the workbooks: newest (highest) ad id first, ads without an id last."""
+        if self.id and str(self.id).isdigit():
+            return (0, -int(self.id), self.link or '')
+        return (1, 0, self.link or '')
+
+    def as_row(self):
+        """Return the values in column order, rendered the same way the dict records were."""
+        additional_details = list(self.additional_details) if self.additional_details is not None else None
+        return (
+            self.id, self.date_published, self.relative_date, self.pin, self.type, self.title,
+            self.description, self.link, self.image, self.price, self.address, additional_details,
+            self.specifications, self.views_no, self.submitter, self.ads, self.membership, self.phone,
+        )
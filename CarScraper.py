@@ -1,28 +1,30 @@
-import pandas as pd
-import json
 import asyncio
-import nest_asyncio  # Allows running async loops within existing event loops (useful in Jupyter environments)
-import re
-import json
-from playwright.async_api import async_playwright  # Async version of Playwright for web automation
+import logging
+from contextlib import asynccontextmanager
 from playwright._impl._errors import Error  # Used to catch navigation errors
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta  # Useful for date arithmetic
 from DetailsScraper import DetailsScraping  # Custom module to scrape details for each type
-
-# # Allow nested event loops (useful in Jupyter)
-# nest_asyncio.apply()
+from BrowserSession import BrowserSession  # Shared browser context with a persistent profile
 
 class CarScraper:
-    def __init__(self, url):
+    def __init__(self, url, session=None):
         self.url = url  # Main page URL to start scraping from
+        self.session = session  # Shared BrowserSession; a temporary one is opened if None
         self.base_url = "https://www.q84sale.com"  # Base domain used to resolve relative links
         self.data = []  # List to hold the final structured data
+        self.logger = logging.getLogger(__name__)  # Logger instance
+
+    @asynccontextmanager
+    async def browser_session(self):
+        # Reuse the shared session if given, otherwise open one just for this scrape
+        if self.session:
+            yield self.session
+            return
+        async with BrowserSession() as session:
+            yield session
 
     async def scrape_brands_and_types(self):
-        # Start an asynchronous Playwright session
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)  # Launch Chromium browser in headless mode
+        # Start (or reuse) the browser session
+        async with self.browser_session() as browser:
             page = await browser.new_page()  # Open a new browser tab
             await page.goto(self.url)  # Navigate to the main URL
 
@@ -33,7 +35,7 @@ class CarScraper:
                 title = await element.get_attribute('title')  # Get brand title (e.g., "Toyota")
                 brand_link = await element.get_attribute('href')  # Get link to that brand's page
 
-                print(f"Brand: {title}, Link: {brand_link}")
+                self.logger.info(f"Brand: {title}, Link: {brand_link}")
 
                 if brand_link:
                     # Construct full URL if the link is relative
@@ -51,7 +53,7 @@ class CarScraper:
                         'types': types
                     })
 
-            await browser.close()  # Close the browser session
+            await page.close()  # Close the main tab, the session itself is closed by its owner
         return self.data  # Return all collected data
 
     async def scrape_types(self, page, brand_link):
@@ -62,7 +64,7 @@ class CarScraper:
             await page.wait_for_selector('.styles_itemWrapper__MTzPB a', timeout=5000)
         except (Error, TimeoutError) as e:
             # Handle cases where the page fails to load
-            print(f"Failed to navigate to {brand_link}: {e}")
+            self.logger.error(f"Failed to navigate to {brand_link}: {e}")
             return []
 
         # Select all type elements (sub-listings under each brand)
@@ -0,0 +1,39 @@
+import logging
+
+RUN = 'run'  # Key of the whole run: trips when types keep failing across brands, e.g. after a site change
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, retry_budget=100, run_failure_threshold=10):
+        self.failure_threshold = failure_threshold  # Consecutive failures before a key is skipped
+        self.thresholds = {RUN: run_failure_threshold}  # Keys with their own threshold
+        self.retry_budget = retry_budget            # Retries allowed for the whole run
+        self.retries_used = 0                       # Retries spent so far
+        self.failures = {}                          # key -> current run of consecutive failures
+        self.open_keys = set()                      # Keys (run / brands / type links) that tripped
+        self.logger = logging.getLogger(__name__)   # Logger instance
+
+    def is_open(self, key):
+        """Return True if work for this key should be skipped."""
+        return key in self.open_keys
+
+    def record_success(self, key):
+        """Reset the consecutive failure count of a key."""
+        self.failures[key] = 0
+
+    def record_failure(self, key):
+        """Count a failure for a key and trip it once the threshold is reached."""
+        self.failures[key] = self.failures.get(key, 0) + 1
+        threshold = self.thresholds.get(key, self.failure_threshold)
+        if self.failures[key] >= threshold and key not in self.open_keys:
+            self.open_keys.add(key)
+            self.logger.warning(f"Circuit opened for {key} after {self.failures[key]} consecutive failures")
+
+    def try_spend_retry(self):
+        """Take one retry from the run budget. Returns False once the budget is exhausted."""
+        if self.retries_used >= self.retry_budget:
+            return False
+        self.retries_used += 1
+        if self.retries_used == self.retry_budget:
+            self.logger.warning(f"Retry budget of {self.retry_budget} exhausted, no further retries this run")
+        return True
@@ -1,86 +1,267 @@
-import pandas as pd
 import json
 import asyncio
-import nest_asyncio
+import logging
 import re
-import json
-from playwright.async_api import async_playwright
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-
-# # Allow nested event loops (useful in Jupyter)
-# nest_asyncio.apply()
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from CarRecord import CarRecord  # Compact record type for each scraped ad
+from BrowserSession import BrowserSession  # Shared browser context with a persistent profile
+
+# Selectors of the fields shown on each card of a type page
+CAR_TYPE_SELECTOR = '.text-6-med.text-neutral_600.styles_category__NQAci'
+TITLE_SELECTOR = '.text-4-med.text-neutral_900.styles_title__l5TTA.undefined'
+PINNED_SELECTOR = '.styles_tail__82mnX p.text-6-med.text-neutral_600'
+
+# Runs in the page: same results as scrape_link / scrape_car_type / scrape_title / scrape_pinned_today
+CARD_LIST_SCRIPT = """
+(cards, args) => cards.map(card => {
+    const rawLink = card.getAttribute('href');
+    const type = card.querySelector(args.typeSelector);
+    const title = card.querySelector(args.titleSelector);
+    const pin = card.querySelector(args.pinSelector);
+    return {
+        link: rawLink ? args.baseUrl + rawLink : null,
+        type: type ? type.innerText : null,
+        title: title ? title.innerText : null,
+        pin: pin && pin.innerText === 'Pinned today' ? 'Pinned today' : 'Not Pinned',
+    };
+})
+"""
+
+# Result page timeouts (ms); the card list gets a short wait, after which the page is checked for ads.
+# Kept short so a broken page or selector costs minutes per type, not the whole run
+NAVIGATION_TIMEOUT = 120000
+CARD_LIST_TIMEOUT = 30000
+
+# Runs in the page: true when the page rendered but has no ads at all, as opposed to
+# ads whose cards no longer match card_selector (a selector break, which is a failure)
+EMPTY_PAGE_SCRIPT = """
+() => !!document.querySelector('#__NEXT_DATA__') && !document.querySelector('a[href*="/listing/"]')
+"""
+
+# Runs in the page: absolute URL of the next result page, or null on the last one.
+# The pagination scheme is not guessed; the page's own rel="next" link is followed.
+NEXT_PAGE_SCRIPT = """
+() => {
+    const next = document.querySelector('link[rel="next"][href], a[rel="next"][href]');
+    return next ? next.href : null;
+}
+"""
 
 class DetailsScraping:
-    def __init__(self, url, retries=3):
+    def __init__(self, url, retries=3, known_links=None, max_pages=50, prefetch_depth=2, breaker=None, session=None):
         self.url = url
         self.retries = retries  # Retry count for robustness
+        self.breaker = breaker  # Shared CircuitBreaker: trips this type and caps retries for the run
+        self.session = session  # Shared BrowserSession (warm cache and cookies), opened here if None
+        self.known_links = set(known_links or [])  # Ad links already collected by the previous run
+        self.max_pages = max_pages  # Upper bound on result pages followed per type
+        self.prefetch_depth = prefetch_depth  # Result pages fetched ahead while the current one is extracted
+        self.card_selector = '.StackedCard_card__Kvggc'
+        self.listing_failed = False  # Set when a result page could not be loaded
+        self.pages_loaded = 0  # Result pages loaded by the last get_car_details call
+        self.failed_cards = []  # Cards whose ad page failed or was skipped by the breaker
+        self.logger = logging.getLogger(__name__)  # Logger instance
+
+    @asynccontextmanager
+    async def browser_session(self):
+        """Use the shared browser session if there is one, otherwise open one for this scraper."""
+        if self.session:
+            yield self.session
+            return
+        self.session = await BrowserSession().start()
+        try:
+            yield self.session
+        finally:
+            session, self.session = self.session, None
+            await session.close()
 
-    async def get_car_details(self):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
+    async def fetch_listing_page(self, session, url):
+        """
+        Load one result page and return its cards and the URL of the next page (None on the last page).
+        A page that loaded but has no ads gives no cards and no next page.
+        Returns None if every attempt failed to load the page or find its cards.
+        """
+        for attempt in range(self.retries):
+            # Every attempt after the first is paid for from the run's retry budget
+            if attempt > 0 and self.breaker and not self.breaker.try_spend_retry():
+                break
 
-            # Set timeouts
-            page.set_default_navigation_timeout(3000000)
-            page.set_default_timeout(3000000)  # General timeout
+            page = await session.new_page()
 
-            cars = []  # To store scraped cars
+            # Set timeouts
+            page.set_default_navigation_timeout(NAVIGATION_TIMEOUT)
+            page.set_default_timeout(NAVIGATION_TIMEOUT)  # General timeout
 
-            for attempt in range(self.retries):
+            try:
+                await page.goto(url, wait_until="domcontentloaded")
                 try:
-                    # Navigate to the page
-                    await page.goto(self.url, wait_until="domcontentloaded")
-                    await page.wait_for_selector('.StackedCard_card__Kvggc', timeout=3000000)
-
-                    # Extract car details
-                    car_cards = await page.query_selector_all('.StackedCard_card__Kvggc')
-                    for card in car_cards:
-                        # Extract car information
-                        link = await self.scrape_link(card)
-                        car_type = await self.scrape_car_type(card)
-                        title = await self.scrape_title(card)
-                        pinned_today = await self.scrape_pinned_today(card)
-
-                        # Scrape scrape_more_details from the car page
-                        scrape_more_details = await self.scrape_more_details(link)
-
-                        cars.append({
-                            'id': scrape_more_details.get('id'),
-                            'date_published': scrape_more_details.get('date_published'),
-                            'relative_date': scrape_more_details.get('relative_date'),
-                            'pin': pinned_today,
-                            'type': car_type,
-                            'title': title,
-                            'description': scrape_more_details.get('description'),
-                            'link': link,
-                            'image': scrape_more_details.get('image'),
-                            'price': scrape_more_details.get('price'),
-                            'address': scrape_more_details.get('address'),
-                            'additional_details': scrape_more_details.get('additional_details'),
-                            'specifications': scrape_more_details.get('specifications'),
-                            'views_no': scrape_more_details.get('views_no'),  # Added views number here
-                            'submitter': scrape_more_details.get('submitter'),
-                            'ads': scrape_more_details.get('ads'),
-                            'membership': scrape_more_details.get('membership'),
-                            'phone': scrape_more_details.get('phone'),
-                        })
-                    break  # Exit loop if successful
-
-                except Exception as e:
-                    print(f"Attempt {attempt + 1} failed for {self.url}: {e}")
-                    if attempt + 1 == self.retries:
-                        print(f"Max retries reached for {self.url}. Returning partial results.")
-                        break
-                finally:
-                    # Close page between attempts to ensure proper cleanup
-                    await page.close()
-                    if attempt + 1 < self.retries:
-                        page = await browser.new_page()
+                    await page.wait_for_selector(self.card_selector, timeout=CARD_LIST_TIMEOUT)
+                except PlaywrightTimeoutError:
+                    if not await page.evaluate(EMPTY_PAGE_SCRIPT):
+                        raise
+                    self.logger.info(f"No ads on {url}")
+                    return [], None
+
+                cards = await self.scrape_card_list(page)
+                next_url = await page.evaluate(NEXT_PAGE_SCRIPT)
+                return cards, next_url
+
+            except Exception as e:
+                self.logger.warning(f"Attempt {attempt + 1} failed for {url}: {e}")
+            finally:
+                # Close page between attempts to ensure proper cleanup
+                await page.close()
+
+        self.logger.error(f"Max retries reached for {url}. Returning partial results.")
+        self.listing_failed = True
+        return None
 
-            await browser.close()
+    async def follow_pages(self, session, page_queue):
+        """
+        Walk the result pages through their next links and put each page's cards on the queue.
+        The queue is bounded by prefetch_depth, so pages are loaded ahead of the extraction
+        without running arbitrarily far ahead. None on the queue marks the end.
+        """
+        url = self.url
+        visited = set()
+        self.pages_loaded = 0
+        try:
+            while url and url not in visited:
+                if len(visited) == self.max_pages:
+                    self.logger.warning(f"Stopped after {self.max_pages} result pages of {self.url}")
+                    break
+                visited.add(url)
+
+                result = await self.fetch_listing_page(session, url)
+                if result is None:
+                    break  # listing_failed is set
+                cards, url = result
+                self.pages_loaded += 1
+                await page_queue.put(cards)
+        except Exception as e:
+            self.logger.error(f"Error while following the result pages of {self.url}: {e}")
+            self.listing_failed = True
+        await page_queue.put(None)
+
+    def select_new_cards(self, cards, seen_links):
+        """
+        Drop cards already scraped in this run or in the previous one.
+        Also reports whether a known, non-pinned ad was reached: listings are sorted
+        newest first, so everything after it was already collected last time.
+        """
+        new_cards = []
+        for card in cards:
+            link = card['link']
+            if link in seen_links:
+                continue
+            if link in self.known_links:
+                # Pinned ads are bumped to the top regardless of age, so they don't mark the boundary
+                if card['pin'] != "Pinned today":
+                    return new_cards, True
+                continue
+            seen_links.add(link)
+            new_cards.append(card)
+        return new_cards, False
+
+    async def get_car_details(self):
+        async with self.browser_session() as session:
+            cars = []  # To store scraped cars
+            seen_links = set()  # Links scraped so far in this run (guards against repeated pages)
+            page_queue = asyncio.Queue(maxsize=self.prefetch_depth)  # Prefetched result pages, in page order
+            producer = asyncio.ensure_future(self.follow_pages(session, page_queue))
+
+            try:
+                while True:
+                    cards = await page_queue.get()
+                    if cards is None:
+                        break  # Last page reached, or a page could not be loaded
+                    if not cards:
+                        break  # The page loaded but has no ads
+
+                    new_cards, reached_known = self.select_new_cards(cards, seen_links)
+                    if not new_cards and not reached_known:
+                        break  # The site served a page we already had
+
+                    cars.extend(await self.scrape_cards(new_cards))
+                    if self.breaker and self.breaker.is_open(self.url):
+                        break  # This type keeps failing, leave the remaining pages alone
+
+                    if reached_known:
+                        break  # The rest was collected by the previous run
+            finally:
+                # Stop loading pages we no longer need
+                producer.cancel()
+                await asyncio.gather(producer, return_exceptions=True)
+
+            self.logger.info(f"Loaded {self.pages_loaded} result pages of {self.url}, {len(cars)} new ads")
             return cars
 
+    async def scrape_cards(self, cards):
+        """
+        Scrape the ad page of each card and build the car records.
+        Failed ads are kept in failed_cards; once the breaker trips for this type
+        the remaining cards are skipped and kept there too.
+        """
+        async with self.browser_session():
+            cars = []
+            for card in cards:
+                if self.breaker and self.breaker.is_open(self.url):
+                    self.failed_cards.append(card)
+                    continue
+
+                # Scrape scrape_more_details from the car page
+                scrape_more_details = await self.scrape_more_details(card['link'])
+
+                # An ad page without an id means the page failed to load or the selectors no longer match
+                if scrape_more_details.get('id') is None:
+                    self.failed_cards.append(card)
+                    if self.breaker:
+                        self.breaker.record_failure(self.url)
+                elif self.breaker:
+                    self.breaker.record_success(self.url)
+
+                cars.append(CarRecord(
+                    id=scrape_more_details.get('id'),
+                    date_published=scrape_more_details.get('date_published'),
+                    relative_date=scrape_more_details.get('relative_date'),
+                    pin=card['pin'],
+                    type=card['type'],
+                    title=card['title'],
+                    description=scrape_more_details.get('description'),
+                    link=card['link'],
+                    image=scrape_more_details.get('image'),
+                    price=scrape_more_details.get('price'),
+                    address=scrape_more_details.get('address'),
+                    additional_details=scrape_more_details.get('additional_details'),
+                    specifications=scrape_more_details.get('specifications'),
+                    views_no=scrape_more_details.get('views_no'),  # Added views number here
+                    submitter=scrape_more_details.get('submitter'),
+                    ads=scrape_more_details.get('ads'),
+                    membership=scrape_more_details.get('membership'),
+                    phone=scrape_more_details.get('phone'),
+                ))
+            return cars
+
+    # Method to scrape link, type, title and pin status of every card on a type page
+    async def scrape_card_list(self, page):
+        """
+        Extract all cards of the page in a single in-page call.
+        Returns plain dicts, so no element handle outlives this call.
+        """
+        return await page.eval_on_selector_all(
+            self.card_selector,
+            CARD_LIST_SCRIPT,
+            {
+                'baseUrl': 'https://www.q84sale.com',
+                'typeSelector': CAR_TYPE_SELECTOR,
+                'titleSelector': TITLE_SELECTOR,
+                'pinSelector': PINNED_SELECTOR,
+            }
+        )
+
     # Method to scrape the link
     async def scrape_link(self, card):
         rawlink = await card.get_attribute('href')
@@ -89,13 +270,13 @@ class DetailsScraping:
 
     # Method to scrape the car type
     async def scrape_car_type(self, card):
-        selector = '.text-6-med.text-neutral_600.styles_category__NQAci'
+        selector = CAR_TYPE_SELECTOR
         element = await card.query_selector(selector)
         return await element.inner_text() if element else None
 
     # Method to scrape the car title
     async def scrape_title(self, card):
-        selector = '.text-4-med.text-neutral_900.styles_title__l5TTA.undefined'
+        selector = TITLE_SELECTOR
         element = await card.query_selector(selector)
         return await element.inner_text() if element else None
 
@@ -108,7 +289,7 @@ class DetailsScraping:
 
     # Method to scrape the pin status
     async def scrape_pinned_today(self, card):
-        selector = '.styles_tail__82mnX p.text-6-med.text-neutral_600'
+        selector = PINNED_SELECTOR
         elements = await card.query_selector_all(selector)
         if elements:
             pin_text = await elements[0].inner_text()
@@ -141,11 +322,11 @@ class DetailsScraping:
                 stripped_time = relative_time_text.replace(" ago", "").strip()
                 return stripped_time  # Clean up whitespace
             else:
-                print("relative_time value not found.")
+                self.logger.warning("relative_time value not found.", extra={'message_type': 'relative_date_missing'})
                 return None
 
         except Exception as e:
-            print(f"Error while scraping relative_time value: {e}")
+            self.logger.warning(f"Error while scraping relative_time value: {e}", extra={'message_type': 'relative_date_error'})
             return None
 
     # Method to scrape date_published
@@ -194,10 +375,10 @@ class DetailsScraping:
                 views_no = await views_element.inner_text()  # Get the text value of x
                 return views_no.strip()  # Remove any extra whitespace
             else:
-                print(f"Views element not found using selector: {views_selector}")
+                self.logger.warning(f"Views element not found using selector: {views_selector}", extra={'message_type': 'views_missing'})
                 return None
         except Exception as e:
-            print(f"Error while scraping views number: {e}")
+            self.logger.warning(f"Error while scraping views number: {e}", extra={'message_type': 'views_error'})
             return None
 
     async def scrape_id(self, page):
@@ -207,14 +388,14 @@ class DetailsScraping:
         # Find the parent element
         parent_element = await page.query_selector(parent_selector)
         if not parent_element:
-            print("Parent element not found")
+            self.logger.warning("Parent element not found", extra={'message_type': 'id_missing'})
             return None
 
         # Nested element with the Ad ID
         ad_id_selector = '.text-4-regular.m-text-5-med.text-neutral_600'
         ad_id_element = await parent_element.query_selector(ad_id_selector)
         if not ad_id_element:
-            print("Ad ID element not found within parent")
+            self.logger.warning("Ad ID element not found within parent", extra={'message_type': 'id_missing'})
             return None
 
         # Extract inner text
@@ -227,7 +408,7 @@ class DetailsScraping:
             # print(f"Matched Ad ID: {match.group(1)}")
             return match.group(1)
         else:
-            print("Regex did not match")
+            self.logger.warning("Regex did not match", extra={'message_type': 'id_missing'})
 
         return None
 
@@ -237,7 +418,7 @@ class DetailsScraping:
             image = await page.query_selector(image_selector)
             return await image.get_attribute('src') if image else None
         except Exception as e:
-            print(f"Error scraping image: {e}")
+            self.logger.warning(f"Error scraping image: {e}", extra={'message_type': 'image_error'})
             return None
 
         # New method to scrape the price
@@ -314,14 +495,14 @@ class DetailsScraping:
                 if phone_number:
                     return phone_number
                 else:
-                    print("Phone number not found in the JSON structure.")
+                    self.logger.warning("Phone number not found in the JSON structure.", extra={'message_type': 'phone_missing'})
                     return None
             else:
-                print("Script tag with id '__NEXT_DATA__' not found.")
+                self.logger.warning("Script tag with id '__NEXT_DATA__' not found.", extra={'message_type': 'phone_missing'})
                 return None
 
         except Exception as e:
-            print(f"Error while scraping phone number: {e}")
+            self.logger.warning(f"Error while scraping phone number: {e}", extra={'message_type': 'phone_error'})
             return None
 
 
@@ -368,12 +549,11 @@ class DetailsScraping:
 
     # Method to scrape more_details
     async def scrape_more_details(self, url):
-        try:
-            # Create a new page for this car detail scraping
-            async with async_playwright() as p:
-
-                browser = await p.chromium.launch(headless=True)
-                page = await browser.new_page()
+        async with self.browser_session() as session:
+            page = None
+            try:
+                # Create a new tab in the shared browser for this car detail scraping
+                page = await session.new_page()
 
                 await page.goto(url, wait_until="domcontentloaded")
                 # await page.wait_for_selector('.StackedCard_card__Kvggc', timeout=3000000)
@@ -411,10 +591,11 @@ class DetailsScraping:
                     'date_published': date_published,
                 }
 
-                await browser.close()
                 return details
 
-        except Exception as e:
-            print(f"Error while scraping more details from {url}: {e}")
-            return {}
-
+            except Exception as e:
+                self.logger.error(f"Error while scraping more details from {url}: {e}")
+                return {}
+            finally:
+                if page:
+                    await page.close()
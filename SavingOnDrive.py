@@ -1,13 +1,17 @@
+import io
 import os
+import hashlib
 import json
 import logging
 import time
 import ssl
+import pandas as pd
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
 from datetime import datetime, timedelta
 from googleapiclient.errors import HttpError
+from ScraperLogging import setup_logging  # Queue-based logging shared by all modules
 
 class SavingOnDrive:
     def __init__(self, credentials_dict):
@@ -24,15 +28,8 @@ class SavingOnDrive:
         self.base_delay = 4  # Base wait time (in seconds) for retry backoff
 
     def setup_logging(self):
-        """Configure logging to both console and file."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(),  # Output to console
-                logging.FileHandler("drive_upload.log")  # Output to log file
-            ]
-        )
+        """Configure logging to both console and file (shared with the scraper, no-op if already done)."""
+        setup_logging()
         self.logger.setLevel(logging.INFO)  # Set logger level to INFO
 
     def authenticate(self):
@@ -102,9 +99,84 @@ class SavingOnDrive:
                 self.logger.error(f"Error in get_or_create_folder: {e}")
                 raise
 
+    def compute_md5(self, file_name):
+        """Compute the MD5 of a local file, comparable with Drive's md5Checksum."""
+        digest = hashlib.md5()
+        with open(file_name, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def find_existing_file(self, name, folder_id):
+        """Return the id and md5Checksum of a same-named file in the folder, or None."""
+        escaped_name = name.replace("\\", "\\\\").replace("'", "\\'")
+        query = (f"name='{escaped_name}' and "
+                 f"'{folder_id}' in parents and "
+                 f"trashed=false")
+        results = self.service.files().list(
+            q=query,
+            spaces='drive',
+            fields='files(id, md5Checksum)'
+        ).execute()
+        files = results.get('files', [])
+        return files[0] if files else None
+
+    def workbook_links(self, source):
+        """Return the (sheet, link) pairs of a workbook, read from a path or a file object."""
+        links = set()
+        for sheet_name, sheet in pd.read_excel(source, sheet_name=None).items():
+            if 'link' in sheet.columns:
+                links.update((sheet_name, link) for link in sheet['link'].dropna())
+        return links
+
+    def is_superset(self, file_name, file_id):
+        """
+        Check whether a local workbook holds every ad of the Drive file it would replace.
+        Anything that is not a workbook, or cannot be compared, is not a superset.
+        """
+        if not file_name.endswith('.xlsx'):
+            return False
+        try:
+            buffer = io.BytesIO()
+            downloader = MediaIoBaseDownload(buffer, self.service.files().get_media(fileId=file_id))
+            done = False
+            while not done:
+                _, done = downloader.next_chunk()
+            buffer.seek(0)
+            return self.workbook_links(file_name) >= self.workbook_links(buffer)
+        except Exception as e:
+            self.logger.warning(f"Could not compare {file_name} with the file on Drive: {e}")
+            return False
+
+    def choose_upload_target(self, file_name, folder_id):
+        """
+        Decide how a file goes into a folder. Returns (name, id of the file to update or None, skip).
+        A same-named file with identical content is skipped, and one the new file fully contains
+        is updated in place. Otherwise the existing file is kept and the new one gets its own
+        name with a content hash, so a smaller workbook (e.g. a same-day re-run with only the
+        new ads) never overwrites a full one.
+        """
+        name = os.path.basename(file_name)
+        md5 = self.compute_md5(file_name)
+        existing = self.find_existing_file(name, folder_id)
+        if not existing:
+            return name, None, False
+        if existing.get('md5Checksum') == md5:
+            return name, existing['id'], True
+        if self.is_superset(file_name, existing['id']):
+            return name, existing['id'], False
+
+        stem, ext = os.path.splitext(name)
+        name = f"{stem}_{md5[:8]}{ext}"
+        existing = self.find_existing_file(name, folder_id)
+        if not existing:
+            return name, None, False
+        return name, existing['id'], existing.get('md5Checksum') == md5
+
     def upload_file(self, file_name, folder_id):
         """
         Upload a file to a specified folder on Google Drive.
+        Same-named files are skipped, updated or kept next to the new one (see choose_upload_target).
         Supports retry with exponential backoff in case of network or SSL errors.
         """
         retry_count = 0
@@ -120,16 +192,32 @@ class SavingOnDrive:
                     self.logger.error(f"Invalid folder ID for file {file_name}")
                     return None
 
-                file_metadata = {
-                    'name': os.path.basename(file_name),  # Upload with original file name
-                    'parents': [folder_id]
-                }
-                
+                # Compare with what is already in the folder
+                name, existing_id, skip = self.choose_upload_target(file_name, folder_id)
+                if skip:
+                    self.logger.info(f"Skipped unchanged {file_name} in folder {folder_id}")
+                    return existing_id
+
                 media = MediaFileUpload(
                     file_name,
                     resumable=True,
                     chunksize=1024*1024  # Upload in 1MB chunks
                 )
+
+                if existing_id:
+                    # The new content contains the old one, replace it instead of adding a duplicate
+                    file = self.service.files().update(
+                        fileId=existing_id,
+                        media_body=media,
+                        fields='id'
+                    ).execute()
+                    self.logger.info(f"Updated changed {file_name} in folder {folder_id}")
+                    return file.get('id')
+
+                file_metadata = {
+                    'name': name,
+                    'parents': [folder_id]
+                }
                 
                 file = self.service.files().create(
                     body=file_metadata,
@@ -137,7 +225,7 @@ class SavingOnDrive:
                     fields='id'
                 ).execute()
                 
-                self.logger.info(f"Successfully uploaded {file_name} to folder {folder_id}")
+                self.logger.info(f"Successfully uploaded {file_name} to folder {folder_id} as {name}")
                 return file.get('id')  # Return uploaded file ID
                 
             except (ssl.SSLEOFError, HttpError) as e:
@@ -154,40 +242,89 @@ class SavingOnDrive:
                 self.logger.error(f"Error uploading file {file_name}: {str(e)}")
                 raise
 
+    def copy_file(self, file_name, file_id, folder_id):
+        """
+        Put an already uploaded file into another folder with a server-side copy,
+        so its content is only sent to Drive once. The local file_name decides, like
+        for an upload, whether a same-named file there is skipped, updated or kept.
+        """
+        name, existing_id, skip = self.choose_upload_target(file_name, folder_id)
+        if skip:
+            self.logger.info(f"Skipped unchanged {file_name} in folder {folder_id}")
+            return existing_id
+
+        if existing_id:
+            # A copy cannot replace the content of an existing file, so update it from the local file
+            media = MediaFileUpload(file_name, resumable=True, chunksize=1024*1024)
+            file = self.service.files().update(
+                fileId=existing_id,
+                media_body=media,
+                fields='id'
+            ).execute()
+            self.logger.info(f"Updated changed {file_name} in folder {folder_id}")
+            return file.get('id')
+
+        file = self.service.files().copy(
+            fileId=file_id,
+            body={'name': name, 'parents': [folder_id]},
+            fields='id'
+        ).execute()
+        self.logger.info(f"Copied {file_name} to folder {folder_id} as {name}")
+        return file.get('id')
+
+    def run_with_retries(self, action, file_name, *args):
+        """Run an upload or copy of file_name, retrying with backoff. Returns the file id, or None on failure."""
+        retry_count = 0
+        while retry_count < self.max_retries:
+            try:
+                return action(file_name, *args)
+            except Exception as e:
+                retry_count += 1
+                if retry_count == self.max_retries:
+                    self.logger.error(f"Failed to upload {file_name} after {self.max_retries} attempts")
+                else:
+                    delay = self.base_delay * (2 ** retry_count)
+                    self.logger.info(f"Retrying upload of {file_name} (attempt {retry_count + 1}) after {delay} seconds")
+                    time.sleep(delay)
+        return None
+
     def save_files(self, files):
         """
         Save a list of files to multiple parent folders on Google Drive.
         Automatically creates a dated subfolder (yesterday's date) inside each parent.
+        Each file is uploaded once, to the first available folder, and copied on Drive to the others.
+        Returns the files that reached every available parent folder.
         """
         try:
             # Use yesterday's date as the folder name
             yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            
+
+            # Create/get a dated folder inside each parent
+            folder_ids = []
             for parent_folder_id in self.parent_folder_ids:
-                # Create/get a dated folder inside each parent
                 folder_id = self.get_or_create_folder(yesterday, parent_folder_id)
                 if not folder_id:
                     self.logger.error(f"Skipping uploads to parent folder {parent_folder_id}")
                     continue
-                
-                for file_name in files:
-                    retry_count = 0
-                    while retry_count < self.max_retries:
-                        try:
-                            # Try uploading each file
-                            self.upload_file(file_name, folder_id)
-                            break
-                        except Exception as e:
-                            retry_count += 1
-                            if retry_count == self.max_retries:
-                                self.logger.error(f"Failed to upload {file_name} after {self.max_retries} attempts")
-                            else:
-                                delay = self.base_delay * (2 ** retry_count)
-                                self.logger.info(f"Retrying upload of {file_name} (attempt {retry_count + 1}) after {delay} seconds")
-                                time.sleep(delay)
-            
+                folder_ids.append(folder_id)
+            if not folder_ids:
+                return []
+
+            uploaded_files = []
+            for file_name in files:
+                file_id = self.run_with_retries(self.upload_file, file_name, folder_ids[0])
+                if not file_id:
+                    continue
+                copies = [
+                    self.run_with_retries(self.copy_file, file_name, file_id, folder_id)
+                    for folder_id in folder_ids[1:]
+                ]
+                if all(copies):
+                    uploaded_files.append(file_name)
+
             self.logger.info("Files upload process completed")
-            
+            return uploaded_files
+
         except Exception as e:
             self.logger.error(f"Error in save_files: {str(e)}")
             raise
@@ -0,0 +1,123 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+queue_listener = None                 # Background writer thread, started once per process
+rate_limit_filter = None              # Filter of the queue handler, read for the summary at shutdown
+setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        message_type = getattr(record, 'message_type', None)
+        if message_type:
+            entry['message_type'] = message_type
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed  # Same-type messages dropped since the previous one
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most max_per_interval records of each message_type per interval.
+    Records without a message_type, and errors, are never limited. The first record
+    after a suppressed stretch carries the number of records that were dropped.
+    """
+
+    def __init__(self, max_per_interval=20, interval=60.0):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval = interval
+        self.windows = {}             # message_type -> [window start, records passed, records dropped]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        message_type = getattr(record, 'message_type', None)
+        if not message_type or record.levelno >= logging.ERROR:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(message_type)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self.windows[message_type] = [now, 1, 0]
+                record.suppressed = suppressed
+                return True
+            if window[1] < self.max_per_interval:
+                window[1] += 1
+                record.suppressed = window[2]
+                window[2] = 0
+                return True
+            window[2] += 1
+            return False
+
+    def take_suppressed(self):
+        """Return the dropped counts not reported yet, per message_type, and reset them."""
+        with self.lock:
+            suppressed = {message_type: window[2] for message_type, window in self.windows.items() if window[2]}
+            for window in self.windows.values():
+                window[2] = 0
+        return suppressed
+
+
+def setup_logging(log_file='scraper.log', level=logging.INFO, max_per_interval=20, interval=60.0):
+    """
+    Configure logging once for every module of the scraper.
+    Callers only put records on a queue; a background thread writes them to the console
+    and, as JSON lines, to log_file. Repeated message types are rate limited before queueing.
+    """
+    global queue_listener, rate_limit_filter
+    with setup_lock:
+        if queue_listener is not None:
+            return
+
+        console_handler = logging.StreamHandler()                   # Output to console
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        file_handler = logging.FileHandler(log_file, encoding='utf-8')  # Output to a log file
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        rate_limit_filter = RateLimitFilter(max_per_interval, interval)
+        queue_handler.addFilter(rate_limit_filter)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        queue_listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler)
+        queue_listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Report what the rate limit dropped in its last windows, flush the queue and stop the background writer."""
+    global queue_listener, rate_limit_filter
+    with setup_lock:
+        if queue_listener is None:
+            return
+        suppressed = rate_limit_filter.take_suppressed()
+        if suppressed:
+            counts = ", ".join(f"{count} {message_type}" for message_type, count in sorted(suppressed.items()))
+            logging.getLogger(__name__).warning(f"Rate limit suppressed {counts}",
+                                                extra={'suppressed': sum(suppressed.values())})
+        queue_listener.stop()
+        queue_listener = None
+        rate_limit_filter = None
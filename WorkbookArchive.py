@@ -0,0 +1,55 @@
+import json
+import logging
+import os
+import shutil
+import zipfile
+
+
+class WorkbookArchive:
+    """
+    Zip archive that brand workbooks are streamed into as soon as each brand is done,
+    so a chunk (or a whole run) is uploaded as a single file. A manifest.json listing
+    brand -> file -> row count per car type is added when the archive is closed.
+    """
+
+    def __init__(self, path):
+        self.path = path                                  # Archive location on disk
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.manifest = []                                # One entry per workbook added
+        self.logger = logging.getLogger(__name__)
+
+    def add(self, brand_name, file_name, row_counts):
+        """
+        Copy a workbook into the archive and delete the local file.
+        row_counts maps each car type, by its full name (sheet names are cut to 31
+        characters and may collide), to its number of rows.
+        """
+        arcname = os.path.basename(file_name)
+        # Fixed entry time keeps the archive reproducible; the copy is streamed, not read into memory
+        info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with open(file_name, 'rb') as source, self.archive.open(info, 'w') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.remove(file_name)
+
+        self.manifest.append({
+            'brand': brand_name,
+            'file': arcname,
+            'rows': sum(row_counts.values()),
+            'types': row_counts,
+        })
+        self.logger.info(f"Added {arcname} to {self.path}")
+
+    def close(self):
+        """Write the manifest and finish the archive. Returns the archive path, or None if it is empty."""
+        if self.manifest:
+            info = zipfile.ZipInfo('manifest.json', date_time=(1980, 1, 1, 0, 0, 0))
+            self.archive.writestr(info, json.dumps(self.manifest, ensure_ascii=False, indent=2),
+                                  compress_type=zipfile.ZIP_DEFLATED)
+        self.archive.close()
+
+        if not self.manifest:
+            os.remove(self.path)
+            return None
+        self.logger.info(f"Archive {self.path} closed with {len(self.manifest)} workbooks")
+        return str(self.path)
@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: per-card element handle extraction vs the single in-page batch call
+on a generated type page with hundreds of cards.
+
+Usage: python benchmarks/card_extraction.py [--cards 500] [--repeat 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from playwright.async_api import async_playwright
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DetailsScraper import DetailsScraping  # noqa: E402
+
+
+def build_fixture(card_count):
+    """Build a type page with the same markup the site uses for its cards."""
+    cards = []
+    for i in range(card_count):
+        pin = "Pinned today" if i % 7 == 0 else "2 Hours"
+        cards.append(
+            f'<a class="StackedCard_card__Kvggc" href="/ar/listing/{100000 + i}">'
+            f'<p class="text-6-med text-neutral_600 styles_category__NQAci">Category {i % 12}</p>'
+            f'<p class="text-4-med text-neutral_900 styles_title__l5TTA undefined">Car title {i}</p>'
+            f'<div class="styles_tail__82mnX"><p class="text-6-med text-neutral_600">{pin}</p></div>'
+            f'</a>'
+        )
+    return f"<html><body>{''.join(cards)}</body></html>"
+
+
+async def per_card(scraper, page):
+    """The previous approach: one handle per card and several round trips for each."""
+    cards = []
+    for card in await page.query_selector_all(scraper.card_selector):
+        cards.append({
+            'link': await scraper.scrape_link(card),
+            'type': await scraper.scrape_car_type(card),
+            'title': await scraper.scrape_title(card),
+            'pin': await scraper.scrape_pinned_today(card),
+        })
+    return cards
+
+
+async def run(card_count, repeat):
+    scraper = DetailsScraping("https://www.q84sale.com/ar/automotive/new-cars-1")
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        await page.set_content(build_fixture(card_count))
+
+        expected = await per_card(scraper, page)
+        assert await scraper.scrape_card_list(page) == expected, "batch extraction differs from per-card extraction"
+
+        for name, extract in (("per-card handles", per_card), ("batch", lambda s, pg: s.scrape_card_list(pg))):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await extract(scraper, page)
+                timings.append(time.perf_counter() - start)
+            print(f"{name:>16}: best {min(timings) * 1000:8.1f} ms for {card_count} cards")
+
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.cards, args.repeat))
@@ -1,24 +1,48 @@
 # Import required libraries
-import pandas as pd
+import time
+startup_begin = time.perf_counter()              # Start of the process, for the startup timing report
+
+import argparse
+import importlib
 import json
 import asyncio
-import nest_asyncio
 import logging
 import os
+import re
+import sys
+import zipfile
+from contextlib import asynccontextmanager
 from pathlib import Path
-from playwright.async_api import async_playwright
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from CarScraper import CarScraper                # Custom class to scrape brand/type info
-from DetailsScraper import DetailsScraping       # Custom class to scrape detailed car data
-from SavingOnDrive import SavingOnDrive          # Custom class to handle Google Drive saving
+from CircuitBreaker import CircuitBreaker, RUN   # Custom class to stop retrying work that keeps failing
+from CarRecord import CarRecord                  # Compact record type for each scraped ad
+from WorkbookArchive import WorkbookArchive      # Zip archive of workbooks uploaded as one file
+from ScraperLogging import setup_logging         # Queue-based logging shared by all modules
+
+# Heavy modules (pandas, Playwright, Google API client) are only imported by the stages that need them:
+#   CarScraper     -> brand/type discovery
+#   DetailsScraper -> detailed car data scraping
+#   pandas         -> Excel export
+#   SavingOnDrive  -> Google Drive upload
+import_timings = {}                              # Module name -> seconds its first import took
+
+FIXED_TIMESTAMP = b'2000-01-01T00:00:00Z'        # Stored instead of the real workbook creation time
+
+
+def lazy_import(module_name):
+    """Import a module on first use and record how long the import took."""
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_timings[module_name] = time.perf_counter() - start
+    return module
 
-# Allow nested event loops to support asyncio in environments like Jupyter or nested async calls
-nest_asyncio.apply()
 
 class MainScraper:
-    def __init__(self, url):
+    def __init__(self, url, browser_profile=None):
         self.url = url                                  # Main page URL to scrape from
+        self.browser_profile = browser_profile           # Browser profile kept across runs (temporary if None)
+        self.session = None                              # BrowserSession shared by all scrapers of a run
         self.data = []                                   # Reserved for overall scraped data (unused in current script)
         self.brand_data = []                             # Tracks processed brand names
         self.chunk_size = 3                              # Number of brands to process per chunk
@@ -29,114 +53,506 @@ class MainScraper:
         self.temp_dir.mkdir(exist_ok=True)               # Create the temp directory if it doesn't exist
         self.upload_retries = 3                          # Number of times to retry uploading to Drive
         self.chunk_delay = 5                             # Delay between processing each chunk (seconds)
+        self.seen_links_file = Path("seen_links.json")   # Ad links collected by previous runs, per type link
+        self.max_seen_links = 1000                       # Most recent links kept per type in the state file
+        self.seen_links = self.load_seen_links()         # type_link -> list of ad links, newest first
+        self.pending_links = {}                          # Local file -> {type_link: ad links}, remembered once uploaded
+        self.breaker = CircuitBreaker()                  # Trips the run/brands/types that keep failing, caps retries per run
+        self.dead_letters_file = Path("dead_letters.json")  # Failed work items, re-runnable with the retry command
+        self.dead_letters = []                           # Failed work items, written to dead_letters_file at the end
+        self.stage_dir = Path("stage_output")            # Outputs kept on disk so later stages can reuse them
+        self.brands_file = self.stage_dir / "brands.json"   # Output of the discover stage
+        self.records_dir = self.stage_dir / "records"    # Output of the scrape stage, one file per brand
+        self.records_of_file = {}                        # Exported Excel file -> records file it was built from
 
     def setup_logging(self):
-        """Configure logging."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.StreamHandler(),                # Output to console
-                logging.FileHandler('scraper.log')      # Output to a log file
-            ]
-        )
+        """Configure logging (shared, queue-based: console plus JSON lines in scraper.log)."""
+        setup_logging('scraper.log')
         self.logger.setLevel(logging.INFO)              # Set log level
 
-    async def process_brand_chunk(self, brand_chunk):
-        """Process a chunk of brands and create their Excel files."""
+    @asynccontextmanager
+    async def browser_session(self):
+        """Open one warm browser session for every scraper of this run."""
+        BrowserSession = lazy_import('BrowserSession').BrowserSession
+        async with BrowserSession(user_data_dir=self.browser_profile) as session:
+            self.session = session
+            try:
+                yield session
+            finally:
+                self.session = None
+
+    def load_seen_links(self):
+        """Load the ad links collected by previous runs, if any."""
+        if not self.seen_links_file.exists():
+            return {}
+        try:
+            with open(self.seen_links_file, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error reading {self.seen_links_file}: {e}")
+            return {}
+
+    def save_seen_links(self):
+        """Persist the collected ad links so the next run can stop at them."""
+        try:
+            with open(self.seen_links_file, 'w', encoding='utf-8') as f:
+                json.dump(self.seen_links, f, ensure_ascii=False)
+        except Exception as e:
+            self.logger.error(f"Error writing {self.seen_links_file}: {e}")
+
+    def remember_links(self, type_link, new_links):
+        """Put this run's new ad links in front of the ones already known for the type."""
+        new_link_set = set(new_links)
+        known_links = [link for link in self.seen_links.get(type_link, []) if link not in new_link_set]
+        self.seen_links[type_link] = (new_links + known_links)[:self.max_seen_links]
+
+    def completed_links(self, all_car_details):
+        """
+        Ad links of the fully scraped types of a brand, by type link.
+        Ads whose page failed (no id) are left out, so they are never taken for scraped ones.
+        """
+        return {
+            type_data['type_link']: [car.link for car in type_data['details'] if car.link and car.id is not None]
+            for type_data in all_car_details if type_data.get('complete')
+        }
+
+    def commit_links(self, uploaded_files):
+        """
+        Remember the links of the uploaded files and save them for the next run.
+        Links of files that never reached Drive stay pending, so their ads are scraped again.
+        """
+        for file in uploaded_files:
+            for type_link, links in self.pending_links.pop(file, {}).items():
+                self.remember_links(type_link, links)
+        self.save_seen_links()
+
+    def load_dead_letters(self):
+        """Load the work items that failed in an earlier run."""
+        if not self.dead_letters_file.exists():
+            return []
+        try:
+            with open(self.dead_letters_file, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            self.logger.error(f"Error reading {self.dead_letters_file}: {e}")
+            return []
+
+    def carry_over_dead_letters(self):
+        """
+        Start the run's dead letters with the failed ads of earlier runs: they are behind the
+        early-stop boundary, so only a retry reaches them again. Failed types are left out,
+        their links were never remembered and this run scrapes them again.
+        """
+        self.dead_letters = [item for item in self.load_dead_letters() if 'card' in item]
+
+    def save_dead_letters(self):
+        """Write the failed work items so they can be re-run on their own."""
+        try:
+            # The same ad can fail again after being carried over
+            unique_items = {}
+            for item in self.dead_letters:
+                unique_items.setdefault(json.dumps(item, sort_keys=True, ensure_ascii=False), item)
+            self.dead_letters = list(unique_items.values())
+
+            if not self.dead_letters:
+                if self.dead_letters_file.exists():
+                    self.dead_letters_file.unlink()      # Nothing left to re-run
+                return
+            with open(self.dead_letters_file, 'w', encoding='utf-8') as f:
+                json.dump(self.dead_letters, f, ensure_ascii=False, indent=2)
+            self.logger.info(f"{len(self.dead_letters)} failed items written to {self.dead_letters_file}")
+        except Exception as e:
+            self.logger.error(f"Error writing {self.dead_letters_file}: {e}")
+
+    async def scrape_type(self, brand, car_type):
+        """
+        Scrape one car type, feeding the circuit breaker and the dead-letter list.
+        Returns the scraped car details (possibly partial) and whether the type was scraped completely.
+        """
+        brand_name = brand.replace(" ", "_")
+        type_name = car_type['title'].replace(" ", "_")  # Normalize type name
+        type_link = car_type['type_link']                # URL to scrape details from
+
+        # Skip the rest of a brand that keeps failing, or everything once types fail across brands
+        if self.breaker.is_open(RUN) or self.breaker.is_open(brand_name):
+            self.logger.info(f"Circuit open for {brand_name}, deferring {type_name}")
+            self.dead_letters.append({'brand': brand, 'title': car_type['title'], 'type_link': type_link})
+            return [], False
+
+        # Instantiate the detail scraper, stopping at ads the previous run already collected
+        DetailsScraping = lazy_import('DetailsScraper').DetailsScraping
+        details_scraper = DetailsScraping(
+            type_link, known_links=self.seen_links.get(type_link), breaker=self.breaker, session=self.session
+        )
+        car_details = []
+        try:
+            car_details = await details_scraper.get_car_details()  # Scrape car detail data
+            type_failed = details_scraper.listing_failed or self.breaker.is_open(type_link)
+        except TimeoutError:
+            self.logger.error(f"Timeout error while scraping {type_name}. Skipping...")
+            type_failed = True
+        except Exception as e:
+            self.logger.error(f"Error processing {type_name}: {str(e)}")
+            type_failed = True
+
+        if type_failed:
+            # Don't remember partial results: the next run must scrape back to the last complete boundary
+            self.breaker.record_failure(brand_name)
+            self.breaker.record_failure(RUN)
+            self.dead_letters.append({'brand': brand, 'title': car_type['title'], 'type_link': type_link})
+            return car_details, False
+
+        self.breaker.record_success(brand_name)
+        self.breaker.record_success(RUN)
+        for card in details_scraper.failed_cards:
+            self.dead_letters.append({'brand': brand, 'title': car_type['title'], 'type_link': type_link, 'card': card})
+        return car_details, True
+
+    def make_reproducible(self, excel_file_name):
+        """
+        Strip the timestamps an xlsx file embeds (zip entry times, created/modified properties)
+        so the same data always gives the same bytes, and the same hash on Drive.
+        """
+        temp_file_name = excel_file_name.with_suffix('.tmp')
+        with zipfile.ZipFile(excel_file_name) as source, \
+                zipfile.ZipFile(temp_file_name, 'w', zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                data = source.read(info.filename)
+                if info.filename == 'docProps/core.xml':
+                    data = re.sub(rb'(<dcterms:(created|modified)[^>]*>)[^<]*', rb'\g<1>' + FIXED_TIMESTAMP, data)
+                target.writestr(zipfile.ZipInfo(info.filename, date_time=(1980, 1, 1, 0, 0, 0)), data,
+                                compress_type=zipfile.ZIP_DEFLATED)
+        os.replace(temp_file_name, excel_file_name)
+
+    def write_brand_file(self, brand_name, all_car_details, file_suffix=""):
+        """Write each car type's data of a brand into its own sheet. Returns the file path or None."""
+        pd = lazy_import('pandas')
+        self.brand_data.append({'Brand': brand_name})  # Save brand info
+        excel_file_name = self.temp_dir / f"{brand_name}{file_suffix}.xlsx"  # Path to save Excel
+
+        try:
+            # Write each car type's data in separate Excel sheets, in a stable order
+            with pd.ExcelWriter(excel_file_name) as writer:
+                for type_data in sorted(all_car_details, key=lambda type_data: type_data['type_name']):
+                    cars = sorted(type_data['details'], key=CarRecord.sort_key)
+                    df = pd.DataFrame.from_records(
+                        (car.as_row() for car in cars), columns=CarRecord.columns
+                    )
+                    sheet_name = type_data['type_name'][:31]  # Sheet names max 31 chars
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            self.make_reproducible(excel_file_name)
+
+            self.logger.info(f"Excel file created for {brand_name} with types")
+            return str(excel_file_name)
+        except Exception as e:
+            self.logger.error(f"Error creating Excel file for {brand_name}: {str(e)}")
+            return None
+
+    async def scrape_brand(self, brand_info):
+        """
+        Scrape every car type of a brand.
+        Returns a list of {'type_name', 'type_link', 'complete', 'details'} entries.
+        """
+        all_car_details = []                                 # Store all car details under this brand
+
+        # Loop through each car type under the brand
+        for car_type in brand_info['types']:
+            car_details, complete = await self.scrape_type(brand_info['brand'], car_type)
+            if car_details:
+                all_car_details.append({
+                    'type_name': car_type['title'].replace(" ", "_"),
+                    'type_link': car_type['type_link'],
+                    'complete': complete,
+                    'details': car_details
+                })
+        return all_car_details
+
+    def save_brand_records(self, brand_name, all_car_details):
+        """
+        Keep a brand's scraped records on disk for the export stage, together with the links
+        to remember once the brand has been uploaded. Records from earlier scrape runs are kept
+        until the upload stage sends them: with the early stop, a run only returns the ads that
+        are new since the previous one.
+        """
+        self.records_dir.mkdir(parents=True, exist_ok=True)
+        records_file = self.records_dir / f"{brand_name}.json"
+        data = {'brand': brand_name, 'types': [], 'pending_links': {}}
+        if records_file.exists():
+            with open(records_file, encoding='utf-8') as f:
+                data = json.load(f)
+
+        # Merge the rows per type: a re-scraped ad replaces its older row
+        link_index = CarRecord.columns.index('link')
+        types = {type_data['type_name']: type_data['rows'] for type_data in data['types']}
+        for type_data in all_car_details:
+            new_rows = [car.as_row() for car in type_data['details']]
+            new_links = {row[link_index] for row in new_rows if row[link_index]}
+            old_rows = [row for row in types.get(type_data['type_name'], []) if row[link_index] not in new_links]
+            types[type_data['type_name']] = new_rows + old_rows
+        data['types'] = [{'type_name': type_name, 'rows': rows} for type_name, rows in types.items()]
+
+        # Merge the links still waiting for an upload
+        for type_link, links in self.completed_links(all_car_details).items():
+            new_link_set = set(links)
+            old_links = [link for link in data['pending_links'].get(type_link, []) if link not in new_link_set]
+            data['pending_links'][type_link] = links + old_links
+
+        self.write_records_file(records_file, data)
+
+    def write_records_file(self, records_file, data):
+        """Write a records file."""
+        with open(records_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def load_brand_records(self, records_file):
+        """Read back the records written by save_brand_records: brand name, car details and pending links."""
+        with open(records_file, encoding='utf-8') as f:
+            data = json.load(f)
+        all_car_details = [
+            {
+                'type_name': type_data['type_name'],
+                'details': [CarRecord(**dict(zip(CarRecord.columns, row))) for row in type_data['rows']]
+            }
+            for type_data in data['types']
+        ]
+        return data['brand'], all_car_details, data.get('pending_links', {})
+
+    async def process_brand_chunk(self, brand_chunk, archive=None):
+        """
+        Process a chunk of brands and create their Excel files.
+        With an archive, each workbook is moved into it as soon as its brand is done.
+        """
         chunk_files = []                                 # List of Excel files created in this chunk
 
         for brand_info in brand_chunk:
             brand_name = brand_info['brand'].replace(" ", "_")  # Normalize brand name for file names
-            types = brand_info['types']                          # List of car types for this brand
-            
-            all_car_details = []                                 # Store all car details under this brand
+            all_car_details = await self.scrape_brand(brand_info)
 
-            # Loop through each car type under the brand
-            for car_type in types:
-                type_name = car_type['title'].replace(" ", "_")  # Normalize type name
-                type_link = car_type['type_link']                # URL to scrape details from
-                
-                details_scraper = DetailsScraping(type_link)     # Instantiate the detail scraper
-                try:
-                    car_details = await details_scraper.get_car_details()  # Scrape car detail data
-                    if car_details:
-                        all_car_details.append({
-                            'type_name': type_name,
-                            'details': car_details
-                        })
-                except TimeoutError:
-                    self.logger.error(f"Timeout error while scraping {type_name}. Skipping...")
-                    continue
-                except Exception as e:
-                    self.logger.error(f"Error processing {type_name}: {str(e)}")
-                    continue
-            
             # Proceed only if there are valid car details
             if all_car_details:
-                self.brand_data.append({'Brand': brand_name})  # Save brand info
-                excel_file_name = self.temp_dir / f"{brand_name}.xlsx"  # Path to save Excel
-
-                try:
-                    # Write each car type's data in separate Excel sheets
-                    with pd.ExcelWriter(excel_file_name) as writer:
-                        for type_data in all_car_details:
-                            df = pd.DataFrame(type_data['details'])
-                            sheet_name = type_data['type_name'][:31]  # Sheet names max 31 chars
-                            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-                    chunk_files.append(str(excel_file_name))  # Add Excel file to chunk list
-                    self.logger.info(f"Excel file created for {brand_name} with types")
-                except Exception as e:
-                    self.logger.error(f"Error creating Excel file for {brand_name}: {str(e)}")
+                excel_file_name = self.write_brand_file(brand_name, all_car_details)
+                if excel_file_name and archive:
+                    row_counts = {type_data['type_name']: len(type_data['details']) for type_data in all_car_details}
+                    archive.add(brand_name, excel_file_name, row_counts)
+                    # The brand only counts as saved once the archive holding it is uploaded
+                    self.pending_links.setdefault(str(archive.path), {}).update(self.completed_links(all_car_details))
+                elif excel_file_name:
+                    chunk_files.append(excel_file_name)  # Add Excel file to chunk list
+                    self.pending_links[excel_file_name] = self.completed_links(all_car_details)
             else:
                 self.logger.info(f"No car details found for {brand_name}. Skipping Excel file creation.")
         
         return chunk_files
 
+    async def scrape_failed_ads(self, brand, ad_items):
+        """Re-scrape individual ads of a brand from the dead-letter list. Returns car details per type."""
+        # Group the cards by type
+        types = {}
+        for item in ad_items:
+            types.setdefault((item['title'], item['type_link']), []).append(item['card'])
+
+        all_car_details = []
+        for (title, type_link), cards in types.items():
+            DetailsScraping = lazy_import('DetailsScraper').DetailsScraping
+            details_scraper = DetailsScraping(type_link, breaker=self.breaker, session=self.session)
+            car_details = await details_scraper.scrape_cards(cards)
+            for card in details_scraper.failed_cards:
+                self.dead_letters.append({'brand': brand, 'title': title, 'type_link': type_link, 'card': card})
+            if car_details:
+                all_car_details.append({
+                    'type_name': title.replace(" ", "_"),
+                    'type_link': type_link,
+                    'complete': False,                   # Single ads, not a whole type
+                    'details': car_details
+                })
+        return all_car_details
+
+    async def retry_brand(self, brand, items, drive_saver):
+        """
+        Re-run the failed types and ads of one brand and upload them as <brand>_retry.xlsx.
+        Returns True once the items are dealt with (uploaded, or nothing to save).
+        """
+        brand_name = brand.replace(" ", "_")
+        types = [{'title': item['title'], 'type_link': item['type_link']} for item in items if 'card' not in item]
+        ad_items = [item for item in items if 'card' in item]
+
+        all_car_details = await self.scrape_brand({'brand': brand, 'types': types}) if types else []
+        all_car_details += await self.scrape_failed_ads(brand, ad_items)
+        if not all_car_details:
+            return True
+
+        excel_file_name = self.write_brand_file(brand_name, all_car_details, file_suffix="_retry")
+        if not excel_file_name:
+            return False
+        self.pending_links[excel_file_name] = self.completed_links(all_car_details)
+        uploaded = await self.upload_chunk_to_drive([excel_file_name], drive_saver)
+        self.commit_links(uploaded)
+        return bool(uploaded)
+
     async def upload_chunk_to_drive(self, files, drive_saver):
-        """Upload a chunk of files to Google Drive with retries."""
-        if not files:
-            return
+        """Upload a chunk of files to Google Drive with retries. Returns the files that were uploaded."""
+        uploaded_files = []
+        remaining_files = list(files)
             
         for attempt in range(self.upload_retries):
+            if not remaining_files:
+                break
             try:
-                drive_saver.save_files(files)  # Attempt to upload files
-                self.logger.info(f"Chunk of {len(files)} files uploaded successfully")
+                uploaded = drive_saver.save_files(remaining_files)  # Attempt to upload files
+                self.logger.info(f"{len(uploaded)} of {len(remaining_files)} files uploaded successfully")
                 
                 # Clean up local files after upload
-                for file in files:
+                for file in uploaded:
                     try:
                         os.remove(file)
                         self.logger.info(f"Deleted local file: {file}")
                     except Exception as e:
                         self.logger.error(f"Error deleting {file}: {e}")
-                break  # Exit retry loop on success
+                uploaded_files.extend(uploaded)
+                remaining_files = [file for file in remaining_files if file not in uploaded]
             except Exception as e:
                 self.logger.error(f"Upload attempt {attempt + 1} failed: {e}")
+
+            if remaining_files:
                 if attempt < self.upload_retries - 1:
                     await asyncio.sleep(2 ** attempt)  # Exponential backoff before retry
                 else:
-                    self.logger.error("Max retries reached for upload")
+                    self.logger.error(f"Max retries reached for upload, {len(remaining_files)} files not uploaded")
+        return uploaded_files
     
-    async def scrape_and_create_excel(self):
-        """Main processing function."""
-        # Step 0: Setup Google Drive credentials from environment
+    def setup_drive(self):
+        """Setup Google Drive credentials from environment. Returns None on failure."""
         try:
             credentials_json = os.environ.get('NEW_CAR_GCLOUD_KEY_JSON')
             if not credentials_json:
                 raise EnvironmentError("NEW_CAR_GCLOUD_KEY_JSON environment variable not found")
             credentials_dict = json.loads(credentials_json)
+            SavingOnDrive = lazy_import('SavingOnDrive').SavingOnDrive
             drive_saver = SavingOnDrive(credentials_dict)
             drive_saver.authenticate()
+            return drive_saver
         except Exception as e:
             self.logger.error(f"Failed to setup Google Drive: {e}")
+            return None
+
+    def cleanup_temp_dir(self):
+        """Remove the temporary folder and the Excel files left in it."""
+        try:
+            for file in self.temp_dir.glob("*"):
+                file.unlink()
+            self.temp_dir.rmdir()
+            self.logger.info("Cleaned up temporary directory")
+        except Exception as e:
+            self.logger.error(f"Error cleaning up temp directory: {e}")
+
+    async def discover(self):
+        """Scrape brands and their car types and keep them on disk for the later stages."""
+        CarScraper = lazy_import('CarScraper').CarScraper
+        scraper = CarScraper(self.url, session=self.session)
+        brand_and_types_data = await scraper.scrape_brands_and_types()
+
+        self.stage_dir.mkdir(exist_ok=True)
+        with open(self.brands_file, 'w', encoding='utf-8') as f:
+            json.dump(brand_and_types_data, f, ensure_ascii=False, indent=2)
+        self.logger.info(f"Discovered {len(brand_and_types_data)} brands, saved to {self.brands_file}")
+        return brand_and_types_data
+
+    async def load_or_discover(self, reuse=True):
+        """Reuse the discover stage output if it exists, otherwise run discovery."""
+        if reuse and self.brands_file.exists():
+            with open(self.brands_file, encoding='utf-8') as f:
+                brand_and_types_data = json.load(f)
+            self.logger.info(f"Reusing {len(brand_and_types_data)} brands from {self.brands_file}")
+            return brand_and_types_data
+        return await self.discover()
+
+    async def scrape_stage(self, reuse=True):
+        """Scrape the detailed car data of every brand and keep the records on disk."""
+        self.carry_over_dead_letters()
+        try:
+            brand_and_types_data = await self.load_or_discover(reuse)
+            for brand_info in brand_and_types_data:
+                brand_name = brand_info['brand'].replace(" ", "_")
+                all_car_details = await self.scrape_brand(brand_info)
+                if all_car_details:
+                    # Links are remembered by the upload stage, once the brand is on Drive
+                    self.save_brand_records(brand_name, all_car_details)
+                else:
+                    self.logger.info(f"No car details found for {brand_name}")
+                if self.breaker.is_open(RUN):
+                    self.logger.error("Car types keep failing across brands, stopping the run")
+                    break
+        finally:
+            self.save_dead_letters()
+
+    def export_stage(self, reuse=False):
+        """
+        Create the Excel files from the records of the scrape stage.
+        With reuse, a workbook exported after its records were last written is kept as it is.
+        """
+        files = []
+        for records_file in sorted(self.records_dir.glob("*.json")):
+            excel_file_name = self.temp_dir / f"{records_file.stem}.xlsx"
+            if (reuse and excel_file_name.exists()
+                    and excel_file_name.stat().st_mtime_ns > records_file.stat().st_mtime_ns):
+                with open(records_file, encoding='utf-8') as f:
+                    pending_links = json.load(f).get('pending_links', {})
+                excel_file_name = str(excel_file_name)
+                self.logger.info(f"Reusing {excel_file_name}, exported after its records")
+            else:
+                brand_name, all_car_details, pending_links = self.load_brand_records(records_file)
+                excel_file_name = self.write_brand_file(brand_name, all_car_details)
+            if excel_file_name:
+                files.append(excel_file_name)
+                self.pending_links[excel_file_name] = pending_links
+                self.records_of_file[excel_file_name] = records_file
+        if not files:
+            self.logger.info(f"No scraped records found in {self.records_dir}, run the scrape stage first")
+        return files
+
+    async def upload_stage(self):
+        """
+        Upload the Excel files of the scraped records to Google Drive, reusing the export stage
+        output where it is newer than the records and exporting the rest again.
+        """
+        # Workbooks without records left were uploaded already, never send them again
+        brands = {records_file.stem for records_file in self.records_dir.glob("*.json")}
+        for file in self.temp_dir.glob("*.xlsx"):
+            if file.stem not in brands:
+                file.unlink()
+        files = self.export_stage(reuse=True)
+        if not files:
             return
 
+        drive_saver = self.setup_drive()
+        if not drive_saver:
+            return
+        uploaded = await self.upload_chunk_to_drive(files, drive_saver)
+        self.commit_links(uploaded)
+
+        # The uploaded brands are on Drive and their links remembered: drop their records, so the
+        # next upload only holds the ads scraped since, like each chunk of the full pipeline
+        for file in uploaded:
+            records_file = self.records_of_file.get(file)
+            if records_file and records_file.exists():
+                records_file.unlink()
+
+    async def scrape_and_create_excel(self, reuse=False, archive_mode=None):
+        """
+        Main processing function.
+        archive_mode 'chunk' uploads one archive per chunk and 'run' a single archive for the
+        whole run, instead of one Excel file per brand.
+        """
+        # Step 0: Setup Google Drive credentials from environment
+        drive_saver = self.setup_drive()
+        if not drive_saver:
+            return
+
+        self.carry_over_dead_letters()
+        run_archive = WorkbookArchive(self.temp_dir / "new_cars.zip") if archive_mode == 'run' else None
         try:
             # Step 1: Scrape brands and their car types
-            scraper = CarScraper(self.url)
-            brand_and_types_data = await scraper.scrape_brands_and_types()
+            brand_and_types_data = await self.load_or_discover(reuse)
 
             # Step 2: Process scraped data in chunks
             for i in range(0, len(brand_and_types_data), self.chunk_size):
@@ -144,32 +560,155 @@ class MainScraper:
                 self.logger.info(f"Processing chunk {i//self.chunk_size + 1}")
                 
                 # Step 3: Create Excel files for the chunk
-                chunk_files = await self.process_brand_chunk(chunk)
+                chunk_number = i // self.chunk_size + 1
+                chunk_archive = None
+                if archive_mode == 'chunk':
+                    chunk_archive = WorkbookArchive(self.temp_dir / f"new_cars_chunk_{chunk_number}.zip")
+                chunk_files = await self.process_brand_chunk(chunk, archive=chunk_archive or run_archive)
+                if chunk_archive:
+                    archive_file = chunk_archive.close()
+                    chunk_files = [archive_file] if archive_file else []
                 
-                # Step 4: Upload files to Google Drive
+                # Step 4: Upload files to Google Drive, then record their ads so the next run can stop at them
                 if chunk_files:
-                    await self.upload_chunk_to_drive(chunk_files, drive_saver)
+                    uploaded = await self.upload_chunk_to_drive(chunk_files, drive_saver)
+                    self.commit_links(uploaded)
+
+                if self.breaker.is_open(RUN):
+                    self.logger.error("Car types keep failing across brands, stopping the run")
+                    break
                 
                 # Step 5: Optional delay before processing next chunk
                 if i + self.chunk_size < len(brand_and_types_data):
                     self.logger.info(f"Waiting {self.chunk_delay} seconds before next chunk...")
                     await asyncio.sleep(self.chunk_delay)
 
+            # Step 6: Upload the whole run as a single archive
+            if run_archive:
+                archive_file = run_archive.close()
+                run_archive = None
+                if archive_file:
+                    uploaded = await self.upload_chunk_to_drive([archive_file], drive_saver)
+                    self.commit_links(uploaded)
+
         except Exception as e:
             self.logger.error(f"Error in scrape_and_create_excel: {e}")
         finally:
-            # Step 6: Cleanup temporary directory
-            try:
-                for file in self.temp_dir.glob("*"):
-                    file.unlink()
-                self.temp_dir.rmdir()
-                self.logger.info("Cleaned up temporary directory")
-            except Exception as e:
-                self.logger.error(f"Error cleaning up temp directory: {e}")
+            if run_archive:
+                run_archive.close()                      # Incomplete archive, removed with the temp directory
+
+            # Step 7: Keep failed work for a separate re-run and cleanup temporary directory
+            self.save_dead_letters()
+            self.cleanup_temp_dir()
+
+    async def retry_dead_letters(self):
+        """Re-run only the work items that failed in the previous run."""
+        items = self.load_dead_letters()
+        if not items:
+            self.logger.info("No failed items to re-run")
+            return
+
+        drive_saver = self.setup_drive()
+        if not drive_saver:
+            return
+
+        remaining = list(items)                          # Items not dealt with yet, kept if the retry stops early
+        try:
+            brands = {}
+            for item in items:
+                brands.setdefault(item['brand'], []).append(item)
+            self.logger.info(f"Re-running {len(items)} failed items of {len(brands)} brands")
+
+            for brand, brand_items in brands.items():
+                failures_before = len(self.dead_letters)
+                if await self.retry_brand(brand, brand_items, drive_saver):
+                    for item in brand_items:
+                        remaining.remove(item)
+                else:
+                    # The brand's original items stay in the list, drop the duplicates recorded meanwhile
+                    del self.dead_letters[failures_before:]
+        except Exception as e:
+            self.logger.error(f"Error in retry_dead_letters: {e}")
+        finally:
+            self.dead_letters.extend(remaining)
+            self.save_dead_letters()
+            self.cleanup_temp_dir()
+
+
+def parse_args(argv=None):
+    """Parse the command line. Without a command the full pipeline runs."""
+    parser = argparse.ArgumentParser(description="Scrape new car ads from q84sale and save them to Google Drive.")
+    parser.add_argument('--url', default="https://www.q84sale.com/ar/automotive/new-cars-1",
+                        help="Page to start scraping from")
+    parser.add_argument('--browser-profile', default=None,
+                        help="Browser profile directory to keep cache and cookies across runs")
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('discover', help="Scrape brands and their car types")
+    scrape_parser = subparsers.add_parser('scrape', help="Scrape car details, reusing the discover output if present")
+    scrape_parser.add_argument('--refresh', action='store_true', help="Run discovery again even if its output exists")
+    subparsers.add_parser('export', help="Create the Excel files from the scraped records")
+    subparsers.add_parser('upload', help="Upload the exported Excel files to Google Drive")
+    full_parser = subparsers.add_parser('full', help="Discover, scrape, export and upload in chunks (default)")
+    full_parser.add_argument('--reuse', action='store_true', help="Reuse the discover output of an earlier run")
+    full_parser.add_argument('--archive', choices=['chunk', 'run'], default=None,
+                             help="Upload one zip archive per chunk or per run instead of one file per brand")
+    subparsers.add_parser('retry', help="Re-run only the work items that failed in the previous run")
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args.command = 'full'
+        args.reuse = False
+        args.archive = None
+    return args
+
+
+async def run_command(main_scraper, args):
+    """Run the stage selected on the command line."""
+    if args.command == 'export':
+        main_scraper.export_stage()
+        return
+    if args.command == 'upload':
+        await main_scraper.upload_stage()
+        return
+
+    # The remaining commands drive the browser: share one warm session between them
+    async with main_scraper.browser_session():
+        if args.command == 'discover':
+            await main_scraper.discover()
+        elif args.command == 'scrape':
+            await main_scraper.scrape_stage(reuse=not args.refresh)
+        elif args.command == 'retry':
+            await main_scraper.retry_dead_letters()
+        else:
+            await main_scraper.scrape_and_create_excel(reuse=args.reuse, archive_mode=args.archive)
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine, also from inside an already running loop (e.g. Jupyter)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    lazy_import('nest_asyncio').apply()          # Allow nested event loops only when actually needed
+    return asyncio.get_event_loop().run_until_complete(coroutine)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    main_scraper = MainScraper(args.url, browser_profile=args.browser_profile)  # Instantiate main scraper
+    main_scraper.logger.info(f"Startup took {(time.perf_counter() - startup_begin) * 1000:.0f} ms "
+                             f"(command: {args.command})")
+
+    command_begin = time.perf_counter()
+    try:
+        run_coroutine(run_command(main_scraper, args))        # Run the selected stage asynchronously
+    finally:
+        imports = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in import_timings.items())
+        main_scraper.logger.info(f"Command '{args.command}' took {time.perf_counter() - command_begin:.1f} s; "
+                                 f"lazy imports: {imports or 'none'}")
 
 
 # Entry point for the script
 if __name__ == "__main__":
-    url = "https://www.q84sale.com/ar/automotive/new-cars-1"  # URL to start scraping from
-    main_scraper = MainScraper(url)                           # Instantiate main scraper
-    asyncio.run(main_scraper.scrape_and_create_excel())       # Run the main process asynchronously
+    main()